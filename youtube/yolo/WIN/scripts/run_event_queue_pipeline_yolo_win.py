@@ -47,16 +47,54 @@ def escape_drawtext(s: str) -> str:
     return s.replace("\\", "\\\\").replace("\n", r"\n").replace(":", r"\:").replace("'", r"\'")
 
 
+_SEC_PREFIX = b'{"sec":'
+
+
+def _peek_sec(line: bytes) -> int | None:
+    # JSON を解析せずに先頭キーの "sec": N だけをバイト列から拾う（拾えなければ None）
+    # 行頭が {"sec": の行に限るので、入れ子の中の "sec" を拾うことはない
+    if not line.startswith(_SEC_PREFIX):
+        return None
+    c = len(_SEC_PREFIX)
+    j = c
+    n = len(line)
+    while j < n and line[j] not in b",}":
+        j += 1
+    try:
+        return int(line[c:j])
+    except ValueError:
+        return None
+
+
+def _sec_is_leading_key(line: bytes) -> bool:
+    # 1 行だけ通常どおり解析し、sec がトップレベルの先頭キーで _peek_sec と同じ値になるか確かめる
+    try:
+        obj = json.loads(line)
+    except json.JSONDecodeError:
+        return False
+    if not isinstance(obj, dict) or next(iter(obj), None) != "sec":
+        return False
+    sec = _peek_sec(line)
+    return sec is not None and sec == obj["sec"]
+
+
 def get_median_cx(raw_yolo_path: Path, start_abs: int, end_abs: int) -> float:
     cxs: List[float] = []
     if not raw_yolo_path.exists():
         return 320.0
 
-    with raw_yolo_path.open("r", encoding="utf-8") as f:
+    fast = None  # 先頭行で行の形を確かめるまでは未定
+    with raw_yolo_path.open("rb") as f:
         for line in f:
             line = line.strip()
             if not line:
                 continue
+            if fast is None:
+                fast = _sec_is_leading_key(line)
+            # 区間外の行は JSON 解析しない（sec が拾えない行だけ通常どおり解析）
+            sec = _peek_sec(line) if fast else None
+            if sec is not None and not (start_abs <= sec <= end_abs):
+                continue
             try:
                 obj = json.loads(line)
             except json.JSONDecodeError:
@@ -1,22 +1,125 @@
 ﻿#!/usr/bin/env python3
 from __future__ import annotations
 
+import asyncio
+import codecs
+import collections
+import functools
+import heapq
 import json
+import locale
 import os
-import queue
-import subprocess
+import re
 import threading
 from datetime import datetime, timedelta, timezone
 import tkinter as tk
 from pathlib import Path
 from tkinter import filedialog, ttk
-from typing import Any, Callable
+from typing import Any, Callable, Iterable, Iterator
+
+try:
+    import orjson
+except ImportError:  # orjson 未導入なら標準 json で動かす
+    orjson = None
 
 ROOT = Path(__file__).resolve().parents[1]
 SCRIPTS = ROOT / "scripts"
 DEFAULT_CONFIG = ROOT / "config.json"
 DEFAULT_API_ENV = ROOT / ".env.win"
 JST = timezone(timedelta(hours=9))
+LOG_MAX_LINES = 5000
+ENV_LINE_RE = re.compile(rb"^[ \t]*([^#=\s][^=\r\n]*)=(.*)$", re.MULTILINE)
+# 全角数字などは strptime 側で ASCII に直させるので、ここは ASCII 数字だけ拾う
+_TS_RE = re.compile(r"^\s*(\d{4})[-/](\d{2})[-/](\d{2})[ T](\d{2}):(\d{2})(?::(\d{2}))?\s*$", re.ASCII)
+
+
+def _find_candidates(root: str, name: str) -> Iterator[str]:
+    # rglob の代わり: DirEntry のキャッシュ済み型情報で潜り、名前一致のみ文字列で返す
+    stack = [root]
+    while stack:
+        d = stack.pop()
+        try:
+            it = os.scandir(d)
+        except OSError:
+            continue
+        with it:
+            for e in it:
+                if e.is_dir(follow_symlinks=False):
+                    stack.append(e.path)
+                elif e.name == name:
+                    yield e.path
+
+
+_START_FORMATS = ("%Y/%m/%d %H:%M", "%Y-%m-%d %H:%M", "%Y/%m/%d %H:%M:%S", "%Y-%m-%d %H:%M:%S")
+
+
+@functools.lru_cache(maxsize=16)
+def _normalize_start_text(raw: str) -> str:
+    m = _TS_RE.match(raw)
+    if m:
+        yy, mm, dd, hh, mi, ss = m.groups()
+        return f"{yy}-{mm}-{dd}T{hh}:{mi}:{ss or '00'}"
+
+    s = raw.strip()
+    if not s:
+        return ""
+
+    # 桁が揃っていない入力（2026/2/6 2:00 など）は C 実装の strptime で受ける
+    for fmt in _START_FORMATS:
+        try:
+            return datetime.strptime(s, fmt).strftime("%Y-%m-%dT%H:%M:%S")
+        except ValueError:
+            pass
+
+    if " " in s and ":" in s:
+        parts = s.split()
+        if len(parts) >= 2:
+            date_part = parts[0].replace("/", "-")
+            time_part = parts[1]
+            d = date_part.split("-")
+            t = time_part.split(":")
+            if len(d) == 3 and len(t) in (2, 3):
+                try:
+                    yy = int(d[0])
+                    mm = int(d[1])
+                    dd = int(d[2])
+                    hh = int(t[0])
+                    mi = int(t[1])
+                    ss = int(t[2]) if len(t) == 3 else 0
+                    return f"{yy:04d}-{mm:02d}-{dd:02d}T{hh:02d}:{mi:02d}:{ss:02d}"
+                except ValueError:
+                    pass
+
+    s2 = s.replace("/", "-")
+    if " " in s2 and "T" not in s2:
+        s2 = s2.replace(" ", "T", 1)
+    if "T" in s2 and len(s2) == 16:
+        s2 += ":00"
+    return s2
+
+
+def _unique_event_dirs(rows: list[dict]) -> list[str]:
+    # 1 パスで重複を落とす（初出順を保つ）
+    seen: set[str] = set()
+    event_dirs: list[str] = []
+    for row in rows:
+        ev = row.get("event_dir")
+        if isinstance(ev, str) and ev and ev not in seen:
+            seen.add(ev)
+            event_dirs.append(ev)
+    return event_dirs
+
+
+def _json_loads(data: bytes | str) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _json_dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
 
 
 class App(tk.Tk):
@@ -25,7 +128,12 @@ class App(tk.Tk):
         self.title("YOLO Windows パイプライン起動")
         self.geometry("980x820")
 
-        self.log_queue: "queue.Queue[str]" = queue.Queue()
+        self.log_queue: "collections.deque[str]" = collections.deque()
+        self._log_lock = threading.Lock()
+
+        # 子プロセスの stdout は 1 本の asyncio ループでまとめて読む
+        self._aio_loop = asyncio.new_event_loop()
+        threading.Thread(target=self._aio_loop.run_forever, daemon=True).start()
 
         self.config_path = tk.StringVar(value=str(DEFAULT_CONFIG))
         self.base_dir = tk.StringVar(value="E:\\masaos_mov")
@@ -42,14 +150,22 @@ class App(tk.Tk):
         self.manual_min_hits = tk.StringVar(value="18")
         self.manual_limit = tk.StringVar(value="300")
         self.manual_candidates: list[dict[str, Any]] = []
+        self._manual_loading = False
 
         self.api_env_file = tk.StringVar(value=str(DEFAULT_API_ENV))
         self.api_key_env_name = tk.StringVar(value="OPENAI_API_KEY")
         self.api_key_value = tk.StringVar(value="")
+        self._config_cache: tuple[str, int, dict] | None = None
+        self._env_cache: dict[Path, tuple[int, dict[str, str]]] = {}
+        self._queue_path_cache: tuple[dict, Path] | None = None
+        # queue ごとの (ファイル識別子, 読んだバイト数, mtime_ns, 直前の末尾バイト, 行)
+        self._queue_tail_state: dict[Path, tuple[tuple[int, int], int, int, bytes, list[dict]]] = {}
 
         self._build_ui()
+        # ログはポーリングせず、_log が投げる仮想イベントで吐き出す
+        self.bind("<<LogReady>>", lambda e: self._drain_logs())
         self.reload_api_settings_from_config(log_warn=False)
-        self.after(100, self._drain_logs)
+        self.after_idle(self._drain_logs)
 
     def _build_ui(self) -> None:
         frm = ttk.Frame(self, padding=12)
@@ -151,6 +267,8 @@ class App(tk.Tk):
         p = filedialog.askopenfilename(filetypes=[("JSON", "*.json"), ("All", "*.*")])
         if p:
             self.config_path.set(p)
+            self._config_cache = None
+            self._queue_path_cache = None
             self.reload_api_settings_from_config(log_warn=True)
 
     def _pick_base(self) -> None:
@@ -164,27 +282,58 @@ class App(tk.Tk):
             self.api_env_file.set(p)
 
     def _log(self, line: str) -> None:
-        self.log_queue.put(line)
+        self._log_many((line,))
+
+    def _log_many(self, lines: Iterable[str]) -> None:
+        # 空→非空になったときだけイベントを投げる（drain は溜まった分を一度に引き取る）
+        with self._log_lock:
+            was_empty = not self.log_queue
+            self.log_queue.extend(lines)
+        if not was_empty:
+            return
+        try:
+            self.event_generate("<<LogReady>>", when="tail")
+        except (tk.TclError, RuntimeError):
+            # ウィンドウ破棄後やメインループ開始前は次の drain に任せる
+            pass
 
     def _drain_logs(self) -> None:
-        while True:
-            try:
-                line = self.log_queue.get_nowait()
-            except queue.Empty:
-                break
-            self.log_text.insert("end", line + "\n")
-            self.log_text.see("end")
-        self.after(100, self._drain_logs)
+        with self._log_lock:
+            batch, self.log_queue = self.log_queue, collections.deque()
+        buf = list(batch)
+        if not buf:
+            return
+        if len(buf) >= LOG_MAX_LINES:
+            # 1 回分だけで上限を超えるなら、古い行は Text に入れる前に捨てる
+            del buf[: len(buf) - LOG_MAX_LINES]
+            self.log_text.delete("1.0", "end")
+        self.log_text.insert("end", "\n".join(buf) + "\n")
+        # 末尾は改行で終わるので end-1c の行番号 = 行数 + 1
+        lines = int(self.log_text.index("end-1c").split(".")[0]) - 1
+        overflow = lines - LOG_MAX_LINES
+        if overflow > 0:
+            self.log_text.delete("1.0", f"{overflow + 1}.0")
+        self.log_text.see("end")
 
     def _read_config(self) -> dict:
+        path = Path(self.config_path.get())
         try:
-            with Path(self.config_path.get()).open("r", encoding="utf-8-sig") as f:
-                return json.load(f)
+            st = path.stat()
+            key = (str(path), st.st_mtime_ns)
+            if self._config_cache is not None and self._config_cache[:2] == key:
+                return self._config_cache[2]
+            with path.open("r", encoding="utf-8-sig") as f:
+                data = json.load(f)
+            self._config_cache = (*key, data)
+            return data
         except Exception as e:
             self._log(f"[WARN] config load failed: {e}")
             return {}
 
     def reload_api_settings_from_config(self, log_warn: bool) -> None:
+        if log_warn:
+            # 明示的な再読込では必ずファイルから読み直す
+            self._config_cache = None
         conf = self._read_config()
         if not conf:
             return
@@ -201,30 +350,28 @@ class App(tk.Tk):
 
     def _parse_env_file(self, env_path: Path) -> dict[str, str]:
         vals: dict[str, str] = {}
-        if not env_path.exists():
+        try:
+            mtime = env_path.stat().st_mtime_ns
+        except OSError:
             return vals
+        cached = self._env_cache.get(env_path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
         try:
-            with env_path.open("r", encoding="utf-8") as f:
-                for raw in f:
-                    line = raw.strip()
-                    if not line or line.startswith("#"):
-                        continue
-                    if "=" not in line:
-                        continue
-                    k, v = line.split("=", 1)
-                    key = k.strip()
-                    if not key:
-                        continue
-                    vals[key] = v.strip().strip('"').strip("'")
+            for m in ENV_LINE_RE.finditer(env_path.read_bytes()):
+                key = m.group(1).decode("utf-8").strip()
+                vals[key] = m.group(2).decode("utf-8").strip().strip('"').strip("'")
         except Exception as e:
             self._log(f"[WARN] env read failed: {e}")
+            return vals
+        self._env_cache[env_path] = (mtime, vals)
         return vals
 
     def _build_subprocess_env(self) -> dict[str, str]:
-        env = os.environ.copy()
+        # .env の解析結果は _parse_env_file 側でキャッシュ済み
         env_path = Path(self.api_env_file.get().strip() or str(DEFAULT_API_ENV))
-        env_vals = self._parse_env_file(env_path)
-        env.update(env_vals)
+        env = os.environ.copy()
+        env.update(self._parse_env_file(env_path))
         return env
 
     def save_api_key_to_env(self) -> None:
@@ -235,149 +382,193 @@ class App(tk.Tk):
             return
 
         env_path = Path(self.api_env_file.get().strip() or str(DEFAULT_API_ENV))
-        env_vals = self._parse_env_file(env_path)
+        env_vals = dict(self._parse_env_file(env_path))
         env_vals[key_name] = key_val
 
         lines = [f"{k}={v}" for k, v in env_vals.items()]
         env_path.parent.mkdir(parents=True, exist_ok=True)
         env_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        self._env_cache.pop(env_path, None)
         self.api_key_value.set("")
         self._log(f"[OK] APIキー保存: {env_path} ({key_name})")
 
     def _run_cmd(self, cmd: list[str], on_done: Callable[[int], None] | None = None) -> None:
-        def worker() -> None:
+        env = self._build_subprocess_env()
+        asyncio.run_coroutine_threadsafe(self._spawn(cmd, env, on_done), self._aio_loop)
+
+    async def _spawn(self, cmd: list[str], env: dict[str, str], on_done: Callable[[int], None] | None) -> None:
+        # ここで落ちると Future ごと捨てられて誰にも見えないので、例外は全部ログに出して rc=-1 扱いにする
+        rc = -1
+        try:
             self._log("$ " + " ".join(cmd))
-            proc = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                cwd=str(ROOT),
-                env=self._build_subprocess_env(),
-            )
-            assert proc.stdout is not None
-            for line in proc.stdout:
-                self._log(line.rstrip("\n"))
-            rc = proc.wait()
-            self._log(f"[exit] {rc}")
-            if on_done is not None:
+            rc = await self._pump_subprocess(cmd, env)
+        except Exception as e:
+            self._log(f"[ERROR] command failed: {type(e).__name__}: {e}")
+            rc = -1
+        self._log(f"[exit] {rc}")
+        if on_done is not None:
+            try:
                 self.after(0, lambda: on_done(rc))
+            except (tk.TclError, RuntimeError):
+                # ウィンドウ破棄後はコールバック先も無い
+                pass
 
-        threading.Thread(target=worker, daemon=True).start()
+    async def _pump_subprocess(self, cmd: list[str], env: dict[str, str]) -> int:
+        decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))(errors="replace")
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+                cwd=str(ROOT),
+                env=env,
+            )
+        except OSError as e:
+            self._log(f"[ERROR] failed to start: {e}")
+            return -1
+        assert proc.stdout is not None
+        # 行ごとではなく 64KB 単位で読み、まとめてデコードして行に割る
+        pending = ""
+        while True:
+            chunk = await proc.stdout.read(65536)
+            if not chunk:
+                break
+            parts = (pending + decoder.decode(chunk)).split("\n")
+            pending = parts.pop()
+            if parts:
+                self._log_many([p.rstrip("\r") for p in parts])
+        pending += decoder.decode(b"", final=True)
+        if pending:
+            self._log(pending.rstrip("\r"))
+        return await proc.wait()
 
     def _normalize_start(self, raw: str) -> str:
-        s = raw.strip()
-        if not s:
-            return ""
-
-        if " " in s and ":" in s:
-            parts = s.split()
-            if len(parts) >= 2:
-                date_part = parts[0].replace("/", "-")
-                time_part = parts[1]
-                d = date_part.split("-")
-                t = time_part.split(":")
-                if len(d) == 3 and len(t) in (2, 3):
-                    try:
-                        yy = int(d[0])
-                        mm = int(d[1])
-                        dd = int(d[2])
-                        hh = int(t[0])
-                        mi = int(t[1])
-                        ss = int(t[2]) if len(t) == 3 else 0
-                        return f"{yy:04d}-{mm:02d}-{dd:02d}T{hh:02d}:{mi:02d}:{ss:02d}"
-                    except ValueError:
-                        pass
-
-        s2 = s.replace("/", "-")
-        if " " in s2 and "T" not in s2:
-            s2 = s2.replace(" ", "T", 1)
-        if "T" in s2 and len(s2) == 16:
-            s2 += ":00"
-        return s2
+        return _normalize_start_text(raw)
 
     def _event_queue_path(self) -> Path | None:
         conf = self._read_config()
+        # _read_config はファイルが変わらない限り同じ dict を返すので、それを鍵にする
+        if self._queue_path_cache is not None and self._queue_path_cache[0] is conf:
+            return self._queue_path_cache[1]
         q = conf.get("event_queue")
         if not q:
             self._log("[WARN] event_queue path missing in config")
             return None
-        return Path(q)
+        path = Path(q)
+        self._queue_path_cache = (conf, path)
+        return path
 
-    def _read_event_rows(self, queue_path: Path) -> list[dict]:
+    def _read_event_rows(self, queue_path: Path, offset: int = 0) -> list[dict]:
         if not queue_path.exists():
             return []
         rows: list[dict] = []
         try:
-            with queue_path.open("r", encoding="utf-8") as f:
+            with queue_path.open("rb") as f:
+                if offset > 0:
+                    f.seek(offset)
                 for line in f:
-                    line = line.lstrip("\ufeff").strip()
+                    line = line.removeprefix(b"\xef\xbb\xbf").strip()
                     if not line:
                         continue
-                    rows.append(json.loads(line))
+                    rows.append(_json_loads(line))
         except Exception as e:
             self._log(f"[WARN] failed to read queue: {e}")
             return []
         return rows
 
+    def _read_event_rows_cached(self, queue_path: Path) -> list[dict]:
+        # 追記のみで増えた場合は前回の続きだけ読む。縮んだ・書き換わった場合は全体を読み直す
+        # （tmp.replace で差し替えられたら inode が変わる。Windows の st_ctime は作成時刻なので
+        #   それも見る。POSIX の st_ctime は追記でも変わるので識別には使わない）
+        state = self._queue_tail_state.get(queue_path)
+        try:
+            st = queue_path.stat()
+        except OSError:
+            self._queue_tail_state.pop(queue_path, None)
+            return []
+        ident = (st.st_ino, st.st_ctime_ns if os.name == "nt" else 0)
+        if state is not None and state[0] != ident:
+            state = None
+        if state is not None and st.st_size == state[1] and st.st_mtime_ns == state[2]:
+            return state[4]
+
+        try:
+            with queue_path.open("rb") as f:
+                start = 0
+                base_rows: list[dict] = []
+                if state is not None and st.st_size > state[1]:
+                    _, size, _, tail, rows = state
+                    f.seek(size - len(tail))
+                    if f.read(len(tail)) == tail:
+                        start = size
+                        base_rows = rows
+                f.seek(start)
+                data = f.read()
+                mtime = os.fstat(f.fileno()).st_mtime_ns
+            new_rows: list[dict] = []
+            for line in data.splitlines():
+                line = line.removeprefix(b"\xef\xbb\xbf").strip()
+                if line:
+                    new_rows.append(_json_loads(line))
+        except Exception as e:
+            self._queue_tail_state.pop(queue_path, None)
+            self._log(f"[WARN] failed to read queue: {e}")
+            return []
+
+        size = start + len(data)
+        tail = (state[3] + data)[-64:] if start and state is not None else data[-64:]
+        rows = base_rows + new_rows
+        self._queue_tail_state[queue_path] = (ident, size, mtime, tail, rows)
+        return rows
+
     def _set_picked_folders(self, event_dirs: list[str]) -> None:
         if not event_dirs:
             self._log("[INFO] pick結果から新規フォルダを検出できませんでした")
             return
-        self.picked_combo["values"] = event_dirs
-        self.picked_folder.set(event_dirs[0])
+        # 同じ一覧なら values を入れ直さない（再レイアウトを避ける）
+        if tuple(self.picked_combo.cget("values")) != tuple(event_dirs):
+            self.picked_combo["values"] = event_dirs
+        if self.picked_folder.get() != event_dirs[0]:
+            self.picked_folder.set(event_dirs[0])
         self._log(f"[OK] picked folders loaded: {len(event_dirs)}")
 
     def reload_picked_from_queue(self) -> None:
         q = self._event_queue_path()
         if q is None:
             return
-        rows = self._read_event_rows(q)
-        event_dirs: list[str] = []
-        for row in rows:
-            ev = row.get("event_dir")
-            if isinstance(ev, str) and ev:
-                event_dirs.append(ev)
-        event_dirs = list(dict.fromkeys(event_dirs))
-        self._set_picked_folders(event_dirs)
-
-
-    def _collect_manual_candidates(self) -> list[dict[str, Any]]:
-        conf = self._read_config()
-        if not conf:
-            return []
-
-        base_dir_raw = self.base_dir.get().strip() or str(conf.get("base_dir", ""))
-        if not base_dir_raw:
-            self._log("[WARN] base_dir is empty")
-            return []
-
-        base_dir = Path(base_dir_raw)
+        rows = self._read_event_rows_cached(q)
+        self._set_picked_folders(_unique_event_dirs(rows))
+
+
+    def _collect_manual_candidates(
+        self,
+        base_dir: Path,
+        candidates_name: str,
+        min_motion: float,
+        min_hits: float,
+        limit: int,
+    ) -> list[dict[str, Any]]:
+        # ワーカースレッドから呼ばれる。Tk 変数には触らないこと
         if not base_dir.exists():
             self._log(f"[WARN] base_dir not found: {base_dir}")
             return []
 
-        candidates_name = str(conf.get("candidates_name", "candidates_20s.jsonl"))
-
-        try:
-            min_motion = float(self.manual_min_motion.get().strip() or "-1e9")
-            min_hits = float(self.manual_min_hits.get().strip() or "-1e9")
-            limit = int(self.manual_limit.get().strip() or "300")
-        except ValueError:
-            self._log("[WARN] Invalid manual candidate filter values")
-            return []
-
         out: list[dict[str, Any]] = []
-        for cand_path in base_dir.rglob(candidates_name):
+        for cand_path in _find_candidates(str(base_dir), candidates_name):
             try:
-                with cand_path.open("r", encoding="utf-8") as f:
+                with open(cand_path, "rb") as f:
                     for idx, raw in enumerate(f):
                         line = raw.strip()
                         if not line:
                             continue
+                        # decode 前にバイト列で弾く（picked_at / video_id は付くときは必ず値あり）
+                        if b'"picked_at"' in line or b'"video_id"' in line:
+                            continue
+                        if b'"start_abs"' not in line or b'"end_abs"' not in line:
+                            continue
                         try:
-                            row = json.loads(line)
-                        except json.JSONDecodeError:
+                            row = _json_loads(line)
+                        except ValueError:
                             continue
 
                         if row.get("picked_at"):
@@ -393,30 +584,82 @@ class App(tk.Tk):
                             continue
 
                         row2 = dict(row)
-                        row2["_source_path"] = str(cand_path)
+                        row2["_source_path"] = cand_path
                         row2["_source_index"] = idx
-                        row2["_session_dir"] = str(cand_path.parent)
+                        row2["_session_dir"] = os.path.dirname(cand_path)
+                        row2["_motion"] = motion
+                        row2["_hits"] = hits
                         out.append(row2)
             except OSError as e:
                 self._log(f"[WARN] candidate read failed: {cand_path} ({e})")
 
-        out.sort(key=lambda r: (float(r.get("motion", -1.0)), float(r.get("hits", -1.0))), reverse=True)
+        key = lambda r: (r["_motion"], r["_hits"])
+        if 0 < limit < len(out) // 2:
+            # 上位 limit 件だけ欲しいときは全件ソートしない
+            return heapq.nlargest(limit, out, key=key)
+        out.sort(key=key, reverse=True)
         if limit > 0:
             out = out[:limit]
         return out
 
     def load_manual_candidates(self) -> None:
-        self.manual_candidates = self._collect_manual_candidates()
+        if self._manual_loading:
+            self._log("[INFO] candidate scan already running")
+            return
+
+        conf = self._read_config()
+        if not conf:
+            return
+
+        base_dir_raw = self.base_dir.get().strip() or str(conf.get("base_dir", ""))
+        if not base_dir_raw:
+            self._log("[WARN] base_dir is empty")
+            return
+
+        candidates_name = str(conf.get("candidates_name", "candidates_20s.jsonl"))
+
+        try:
+            min_motion = float(self.manual_min_motion.get().strip() or "-1e9")
+            min_hits = float(self.manual_min_hits.get().strip() or "-1e9")
+            limit = int(self.manual_limit.get().strip() or "300")
+        except ValueError:
+            self._log("[WARN] Invalid manual candidate filter values")
+            return
+
+        self._manual_loading = True
+        args = (Path(base_dir_raw), candidates_name, min_motion, min_hits, limit)
+        threading.Thread(target=self._bg_load_candidates, args=args, daemon=True).start()
+
+    def _bg_load_candidates(
+        self,
+        base_dir: Path,
+        candidates_name: str,
+        min_motion: float,
+        min_hits: float,
+        limit: int,
+    ) -> None:
+        out: list[dict[str, Any]] = []
+        try:
+            out = self._collect_manual_candidates(base_dir, candidates_name, min_motion, min_hits, limit)
+        except Exception as e:
+            self._log(f"[WARN] candidate scan failed: {e}")
+        finally:
+            self.after(0, lambda: self._install_manual_candidates(out))
+
+    def _install_manual_candidates(self, rows: list[dict[str, Any]]) -> None:
+        self._manual_loading = False
+        self.manual_candidates = rows
         self.manual_listbox.delete(0, tk.END)
 
+        items: list[str] = []
         for row in self.manual_candidates:
             s = int(row.get("start_abs", 0))
             e = int(row.get("end_abs", 0))
             ev = f"{s:05d}_{e:05d}"
-            motion = float(row.get("motion", -1.0))
-            hits = float(row.get("hits", -1.0))
             sess = Path(str(row.get("_session_dir", ""))).name
-            self.manual_listbox.insert(tk.END, f"{ev} | motion={motion:.3f} | hits={hits:.0f} | session={sess}")
+            items.append(f"{ev} | motion={row['_motion']:.3f} | hits={row['_hits']:.0f} | session={sess}")
+        if items:
+            self.manual_listbox.insert(tk.END, *items)
 
         self._log(f"[OK] manual candidates loaded: {len(self.manual_candidates)}")
 
@@ -475,42 +718,46 @@ class App(tk.Tk):
         for src, idxs in by_file.items():
             p2 = Path(src)
             try:
-                src_rows = []
-                with p2.open("r", encoding="utf-8") as f:
-                    for line in f:
-                        line = line.strip()
-                        if line:
-                            src_rows.append(json.loads(line))
-                for idx in idxs:
-                    if 0 <= idx < len(src_rows):
-                        src_rows[idx]["picked_at"] = picked_at
-                        src_rows[idx]["pick_id"] = pick_id
-                p2.write_text("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in src_rows), encoding="utf-8")
+                # _source_index は生の行番号。触る行だけ decode/encode し、他の行はそのまま書き戻す
+                raw = p2.read_bytes().splitlines()
+                for idx in sorted(set(idxs)):
+                    if 0 <= idx < len(raw):
+                        obj = _json_loads(raw[idx])
+                        obj["picked_at"] = picked_at
+                        obj["pick_id"] = pick_id
+                        raw[idx] = _json_dumps(obj)
+                p2.write_bytes(b"\n".join(raw) + b"\n")
             except Exception as e:
                 self._log(f"[WARN] pick mark failed: {p2} ({e})")
 
+        rows_out: list[dict[str, Any]] = []
+        queue_logs: list[str] = []
+        for i, row in enumerate(selected_rows):
+            s = int(row.get("start_abs", 0))
+            e = int(row.get("end_abs", 0))
+            event_name = f"{s:05d}_{e:05d}"
+            session_dir = Path(str(row.get("_session_dir", "")))
+            event_dir = session_dir / "events" / event_name
+            publish_at = (start_dt + timedelta(hours=i * pitch_hours)).isoformat()
+            rows_out.append({
+                "session_dir": str(session_dir),
+                "event_name": event_name,
+                "event_dir": str(event_dir),
+                "frames_dir": str(event_dir / "images_cropped"),
+                "publishAt": publish_at,
+                "route": route,
+                "motion": row.get("motion"),
+                "hits": row.get("hits"),
+                "pick_reason": "manual_list_select",
+            })
+            queue_logs.append(f"[QUEUE] {event_name} motion={row['_motion']:.3f} hits={row['_hits']:.0f} publishAt={publish_at}")
+
+        # まとめて 1 回で追記する
         q.parent.mkdir(parents=True, exist_ok=True)
-        with q.open("a", encoding="utf-8") as f:
-            for i, row in enumerate(selected_rows):
-                s = int(row.get("start_abs", 0))
-                e = int(row.get("end_abs", 0))
-                event_name = f"{s:05d}_{e:05d}"
-                session_dir = Path(str(row.get("_session_dir", "")))
-                event_dir = session_dir / "events" / event_name
-                publish_at = (start_dt + timedelta(hours=i * pitch_hours)).isoformat()
-                out_row = {
-                    "session_dir": str(session_dir),
-                    "event_name": event_name,
-                    "event_dir": str(event_dir),
-                    "frames_dir": str(event_dir / "images_cropped"),
-                    "publishAt": publish_at,
-                    "route": route,
-                    "motion": row.get("motion"),
-                    "hits": row.get("hits"),
-                    "pick_reason": "manual_list_select",
-                }
-                f.write(json.dumps(out_row, ensure_ascii=False) + "\n")
-                self._log(f"[QUEUE] {event_name} motion={float(row.get('motion', -1.0)):.3f} hits={float(row.get('hits', -1.0)):.0f} publishAt={publish_at}")
+        with q.open("ab") as f:
+            f.write(b"".join(_json_dumps(r) + b"\n" for r in rows_out))
+        for line in queue_logs:
+            self._log(line)
 
         self._log(f"[OK] selected candidates enqueued: {len(selected_rows)}")
 
@@ -527,7 +774,8 @@ class App(tk.Tk):
 
     def run_pick(self) -> None:
         q = self._event_queue_path()
-        before_rows = self._read_event_rows(q) if q is not None else []
+        # 追記前のサイズだけ覚えておき、完了後は増えた分だけ読む
+        before_offset = q.stat().st_size if q is not None and q.exists() else 0
 
         cmd = [
             "python",
@@ -557,15 +805,13 @@ class App(tk.Tk):
                 return
             if q is None:
                 return
-            after_rows = self._read_event_rows(q)
-            new_rows = after_rows[len(before_rows) :] if len(after_rows) >= len(before_rows) else after_rows
-            event_dirs: list[str] = []
-            for row in new_rows:
-                ev = row.get("event_dir")
-                if isinstance(ev, str) and ev:
-                    event_dirs.append(ev)
-            event_dirs = list(dict.fromkeys(event_dirs))
-            self._set_picked_folders(event_dirs)
+            try:
+                size = q.stat().st_size
+            except OSError:
+                size = 0
+            # 縮んでいたら書き換えられたとみなし全体を読む（従来どおり）
+            new_rows = self._read_event_rows(q, before_offset if size >= before_offset else 0)
+            self._set_picked_folders(_unique_event_dirs(new_rows))
 
         self._run_cmd(cmd, on_done=on_done)
 
@@ -581,7 +827,7 @@ class App(tk.Tk):
         self._run_cmd(cmd)
 
     def open_win_folder(self) -> None:
-        subprocess.Popen(["explorer", str(ROOT)])
+        os.startfile(str(ROOT))
 
     def open_selected_picked_folder(self) -> None:
         p = self.picked_folder.get().strip()
@@ -590,13 +836,13 @@ class App(tk.Tk):
             return
         target = Path(p)
         if target.exists():
-            subprocess.Popen(["explorer", str(target)])
+            os.startfile(str(target))
             return
 
         parent_events = target.parent
         if parent_events.exists():
             self._log(f"[INFO] eventフォルダ未作成のため親を開きます: {parent_events}")
-            subprocess.Popen(["explorer", str(parent_events)])
+            os.startfile(str(parent_events))
             return
 
         self._log(f"[WARN] フォルダが見つかりません: {target}")
@@ -12,10 +12,23 @@ build_candidates_20s.py  (NON-OVERLAP = stride 20s)
 """
 
 import argparse
-import json
+import fnmatch
 import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from jsonl_util import json_line, json_loads
+
+try:
+    import numba
+except ImportError:  # numba 未導入なら NumPy 版の窓ループを使う
+    numba = None
 
 # ====== 確定フィルタ ======
 CONF_MIN = 0.40
@@ -29,94 +42,141 @@ HITS_MIN = 15
 CUT_HEAD_SEC = 300     # 前5分カット
 CUT_TAIL_SEC = 300     # 後ろ5分カット
 
+# “全画面誤検出”除外（このスレで決めた）
+FS_Y2_MAX = 358.0      # y2=360張り付き対策（y2 がこれ以上なら除外）
+FS_Y1_MIN = 2.0        # y1 がこれ以下なら除外
+FS_SIZE_MAX = 320.0    # w / h がこれ以上なら除外
 
-def pctl(vals: List[float], q: float) -> Optional[float]:
-    if not vals:
-        return None
-    s = sorted(vals)
-    if len(s) == 1:
-        return s[0]
-    pos = q * (len(s) - 1)
+
+def _pctl_index(n: int, q: float) -> Tuple[int, int, float]:
+    # 線形補間パーセンタイルの (lo, hi, frac)
+    pos = q * (n - 1)
     lo = int(math.floor(pos))
     hi = int(math.ceil(pos))
-    if lo == hi:
-        return s[lo]
-    frac = pos - lo
-    return s[lo] * (1 - frac) + s[hi] * frac
-
-
-def motion_p90_p10(cx_list: List[float]) -> Optional[float]:
-    p10 = pctl(cx_list, 0.10)
-    p90 = pctl(cx_list, 0.90)
-    if p10 is None or p90 is None:
-        return None
-    return float(p90 - p10)
-
-
-def reject_fullscreen(bb: List[float]) -> bool:
-    # “全画面誤検出”除外（このスレで決めた）
-    x1, y1, x2, y2 = bb
-    w = x2 - x1
-    h = y2 - y1
-    if y2 >= 358:   # y2=360張り付き対策
-        return True
-    if y1 <= 2:
-        return True
-    if h >= 320:
-        return True
-    if w >= 320:
-        return True
-    return False
+    return lo, hi, pos - lo
 
 
-def is_valid_det(obj: Dict[str, Any]) -> bool:
-    conf = float(obj.get("conf", 0.0))
-    bb = obj.get("bbox_xyxy")
-    if conf < CONF_MIN:
-        return False
-    if not (isinstance(bb, list) and len(bb) == 4):
-        return False
-
-    x1, y1, x2, y2 = map(float, bb)
-    bb = [x1, y1, x2, y2]
-
-    if reject_fullscreen(bb):
-        return False
-
-    w = x2 - x1
-    if w < BBOX_W_MIN or w > BBOX_W_MAX:
-        return False
-
-    return True
-
-
-def cx_of(bb: List[float]) -> float:
-    x1, y1, x2, y2 = bb
-    return (x1 + x2) / 2.0
-
-
-def load_per_sec(raw_yolo_jsonl: Path) -> Dict[int, Dict[str, Any]]:
-    per: Dict[int, Dict[str, Any]] = {}
-    with raw_yolo_jsonl.open("r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            obj = json.loads(line)
-            if "sec" not in obj:
-                continue
-            sec = int(obj["sec"])
-            per[sec] = obj
-    return per
-
-
-def infer_duration_sec(per: Dict[int, Dict[str, Any]]) -> int:
-    if not per:
-        return 0
-    return max(per.keys()) + 1
+def _pctl_at(part: np.ndarray, lo: int, hi: int, frac: float) -> float:
+    if lo == hi:
+        return float(part[lo])
+    return float(part[lo]) * (1 - frac) + float(part[hi]) * frac
 
 
-def build_candidates(per: Dict[int, Dict[str, Any]], dur_sec: int) -> List[Dict[str, Any]]:
+def motion_p90_p10(cx: np.ndarray) -> Optional[float]:
+    n = len(cx)
+    if n == 0:
+        return None
+    if n == 1:
+        return 0.0
+    # 全ソートせず、p10/p90 に必要な順位だけ np.partition で確定させる
+    i10 = _pctl_index(n, 0.10)
+    i90 = _pctl_index(n, 0.90)
+    part = np.partition(cx, sorted({i10[0], i10[1], i90[0], i90[1]}))
+    return float(_pctl_at(part, *i90) - _pctl_at(part, *i10))
+
+
+@dataclass
+class PerSec:
+    # 1秒ごとの検出を列ごとの配列で持つ（index = sec、検出なしは NaN）
+    conf: np.ndarray
+    x1: np.ndarray
+    y1: np.ndarray
+    x2: np.ndarray
+    y2: np.ndarray
+
+
+def load_per_sec(raw_yolo_jsonl: Path) -> Tuple[PerSec, int]:
+    # dict を経由せず、(sec, conf, x1, y1, x2, y2) を溜めてから配列へ一括で書き込む
+    secs: List[int] = []
+    vals: List[Tuple[float, float, float, float, float]] = []
+    nan = float("nan")
+    max_sec = -1
+    with raw_yolo_jsonl.open("rb") as f:
+        data = f.read()
+    for line in data.splitlines():
+        if not line or line.isspace():
+            continue
+        obj = json_loads(line)
+        if "sec" not in obj:
+            continue
+        sec = int(obj["sec"])
+        if sec < 0:
+            continue
+        bb = obj.get("bbox_xyxy")
+        if isinstance(bb, list) and len(bb) == 4:
+            x1, y1, x2, y2 = map(float, bb)
+        else:
+            x1 = y1 = x2 = y2 = nan
+        if sec > max_sec:
+            max_sec = sec
+        secs.append(sec)
+        vals.append((float(obj.get("conf", 0.0)), x1, y1, x2, y2))
+
+    if not secs:
+        empty = np.full((5, 0), np.nan, dtype=np.float64)
+        return PerSec(*empty), max_sec
+
+    sec_arr = np.asarray(secs, dtype=np.int64)
+    val_arr = np.asarray(vals, dtype=np.float64)
+    dur = max_sec + 1
+    # 同じ sec が複数行あるときは最後の行を採用（従来の dict 上書きと同じ）
+    _, last = np.unique(sec_arr[::-1], return_index=True)
+    keep = len(sec_arr) - 1 - last
+    table = np.full((5, dur), np.nan, dtype=np.float64)
+    table[:, sec_arr[keep]] = val_arr[keep].T
+    return PerSec(*table), max_sec
+
+
+def valid_mask(per: PerSec) -> np.ndarray:
+    # conf / 幅 / 全画面除外を全秒まとめて判定（NaN は常に False）
+    w = per.x2 - per.x1
+    h = per.y2 - per.y1
+    return (
+        (per.conf >= CONF_MIN)
+        & (w >= BBOX_W_MIN) & (w <= BBOX_W_MAX)
+        & (per.y2 < FS_Y2_MAX) & (per.y1 > FS_Y1_MIN)
+        & (h < FS_SIZE_MAX) & (w < FS_SIZE_MAX)
+    )
+
+
+def _scan_windows_kernel(cx, valid, start_min, start_max, win, stride, hits_min):
+    # numba 用の窓ループ本体（成立秒の cx を並べ、p90 - p10 を pctl と同じ線形補間で出す）
+    n = (start_max - start_min) // stride + 1
+    starts = np.empty(n, dtype=np.int64)
+    hits_out = np.empty(n, dtype=np.int64)
+    motions = np.empty(n, dtype=np.float64)
+    buf = np.empty(win, dtype=np.float64)
+    k = 0
+    for start in range(start_min, start_max + 1, stride):
+        h = 0
+        for t in range(start, start + win):
+            if valid[t]:
+                buf[h] = cx[t]
+                h += 1
+        if h < hits_min or h == 0:
+            continue
+        s = np.sort(buf[:h])
+        p = np.empty(2, dtype=np.float64)
+        for j in range(2):
+            pos = (0.10 if j == 0 else 0.90) * (h - 1)
+            lo = int(math.floor(pos))
+            hi = int(math.ceil(pos))
+            if lo == hi:
+                p[j] = s[lo]
+            else:
+                frac = pos - lo
+                p[j] = s[lo] * (1 - frac) + s[hi] * frac
+        starts[k] = start
+        hits_out[k] = h
+        motions[k] = p[1] - p[0]
+        k += 1
+    return starts[:k], hits_out[:k], motions[:k]
+
+
+_scan_windows_nb = numba.njit(cache=True)(_scan_windows_kernel) if numba is not None else None
+
+
+def build_candidates(per: PerSec, dur_sec: int) -> List[Dict[str, Any]]:
     if dur_sec <= 0:
         return []
 
@@ -127,25 +187,34 @@ def build_candidates(per: Dict[int, Dict[str, Any]], dur_sec: int) -> List[Dict[
 
     out: List[Dict[str, Any]] = []
 
+    valid = valid_mask(per)
+    cx = (per.x1 + per.x2) * 0.5
+
+    if _scan_windows_nb is not None:
+        starts, hits_arr, motions = _scan_windows_nb(
+            cx, valid, start_min, start_max, WIN_SEC, STRIDE_SEC, HITS_MIN
+        )
+        for start, hits, m in zip(starts.tolist(), hits_arr.tolist(), motions.tolist()):
+            out.append({
+                "start_abs": start,
+                "end_abs": start + WIN_SEC,
+                "motion": round(float(m), 3),
+                "hits": hits,
+            })
+        return out
+
+    # 成立秒の累積和：窓の hits は cs[end] - cs[start] の O(1)
+    cs = np.concatenate(([0], np.cumsum(valid, dtype=np.int32)))
+
     # ★非重複：start += 20
     for start in range(start_min, start_max + 1, STRIDE_SEC):
-        cx_list: List[float] = []
-        hits = 0
-
-        for t in range(start, start + WIN_SEC):
-            obj = per.get(t)
-            if not obj:
-                continue
-            if not is_valid_det(obj):
-                continue
-            bb = list(map(float, obj["bbox_xyxy"]))
-            hits += 1
-            cx_list.append(cx_of(bb))
+        hits = int(cs[start + WIN_SEC] - cs[start])
 
         if hits < HITS_MIN:
             continue
 
-        m = motion_p90_p10(cx_list)
+        win = slice(start, start + WIN_SEC)
+        m = motion_p90_p10(cx[win][valid[win]])
         if m is None:
             continue
 
@@ -161,14 +230,47 @@ def build_candidates(per: Dict[int, Dict[str, Any]], dur_sec: int) -> List[Dict[
 
 def write_jsonl_atomic(path: Path, rows: List[Dict[str, Any]]) -> None:
     tmp = path.with_suffix(path.suffix + ".tmp")
-    with tmp.open("w", encoding="utf-8") as f:
-        for r in rows:
-            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+    tmp.write_bytes(b"".join(json_line(r) for r in rows))
     tmp.replace(path)
 
 
-def is_session_dir(p: Path) -> bool:
-    return (p / "raw_yolo.jsonl").exists()
+def find_sessions(base: Path, pattern: str, out_name: str, force: bool) -> Tuple[List[Path], int]:
+    # 走査と同時に「作成済み」を落とす。戻り値は (処理対象, 作成済みでスキップした数)
+    todo: List[Path] = []
+    skipped = 0
+    for d in _iter_session_candidates(base, pattern):
+        if not os.path.exists(os.path.join(d, "raw_yolo.jsonl")):
+            continue
+        if not force and os.path.exists(os.path.join(d, out_name)):
+            skipped += 1
+            continue
+        todo.append(Path(d))
+    todo.sort()
+    return todo, skipped
+
+
+def _iter_session_candidates(base: Path, pattern: str):
+    # 直下だけのパターンは os.scandir 1 回で済ませる（共有フォルダでは stat が高い）
+    # 階層をまたぐもの（区切り文字や再帰の ** を含む）は従来どおり Path.glob に任せる
+    if "/" in pattern or os.sep in pattern or "**" in pattern:
+        for p in base.glob(pattern):
+            if p.is_dir():
+                yield str(p)
+        return
+    with os.scandir(base) as it:
+        for entry in it:
+            if entry.is_dir() and fnmatch.fnmatch(entry.name, pattern):
+                yield entry.path
+
+
+def process_session(sess: Path, out_name: str, dry_run: bool) -> Tuple[str, int, int]:
+    # 1セッション分（プロセスプールから呼ぶのでトップレベル関数のまま）
+    per, max_sec = load_per_sec(sess / "raw_yolo.jsonl")
+    dur = max_sec + 1
+    cands = build_candidates(per, dur)
+    if not dry_run:
+        write_jsonl_atomic(sess / out_name, cands)
+    return sess.name, dur, len(cands)
 
 
 def main():
@@ -178,39 +280,38 @@ def main():
     ap.add_argument("--force", action="store_true", help="既存 candidates があっても再生成")
     ap.add_argument("--dry-run", action="store_true", help="書き込みなし（件数表示のみ）")
     ap.add_argument("--out-name", default="candidates_20s.jsonl", help="出力名（default candidates_20s.jsonl）")
+    ap.add_argument("--workers", type=int, default=0, help="並列プロセス数（default 0 = CPU数、1 で直列）")
     args = ap.parse_args()
 
     base = Path(args.base_dir)
     if not base.exists():
         raise SystemExit(f"base_dir not found: {base}")
 
-    sessions = sorted([p for p in base.glob(args.pattern) if p.is_dir() and is_session_dir(p)])
-    if not sessions:
+    todo, skipped = find_sessions(base, args.pattern, args.out_name, args.force)
+    if not todo and not skipped:
         print("[WARN] no session dir found (raw_yolo.jsonl not found)")
         return
 
     written = 0
-    skipped = 0
-
-    for sess in sessions:
-        raw = sess / "raw_yolo.jsonl"
-        out = sess / args.out_name
-
-        if out.exists() and not args.force:
-            skipped += 1
-            continue
-
-        per = load_per_sec(raw)
-        dur = infer_duration_sec(per)
-        cands = build_candidates(per, dur)
-
-        print(f"[SESSION] {sess.name}  dur≈{dur}s  candidates={len(cands)}")
-
-        if args.dry_run:
-            continue
 
-        write_jsonl_atomic(out, cands)
-        written += 1
+    # セッション同士は独立（各自の candidates を atomic に書くだけ）なのでプロセス並列
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    job_args = (todo, repeat(args.out_name), repeat(args.dry_run))
+    ex: Optional[ProcessPoolExecutor] = None
+    if workers > 1 and len(todo) > 1:
+        ex = ProcessPoolExecutor(max_workers=min(workers, len(todo)))
+        results = ex.map(process_session, *job_args, chunksize=1)
+    else:
+        results = map(process_session, *job_args)
+
+    try:
+        for name, dur, n in results:
+            print(f"[SESSION] {name}  dur≈{dur}s  candidates={n}")
+            if not args.dry_run:
+                written += 1
+    finally:
+        if ex is not None:
+            ex.shutdown()
 
     print(f"[DONE] written={written}  skipped={skipped}  dry_run={args.dry_run}")
 
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+jsonl_util.py
+- youtube/yolo 配下のスクリプトで共通の JSONL 読み書きヘルパー
+- orjson があれば使い、無ければ標準 json に落とす
+- スクリプトはこのディレクトリで直接実行する前提（同じ階層から import する）
+"""
+
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterator
+
+try:
+    import orjson
+except ImportError:  # orjson 未導入なら標準 json で読み書きする
+    orjson = None
+
+json_loads = orjson.loads if orjson is not None else json.loads
+
+
+def json_dumps(obj: Dict[str, Any]) -> bytes:
+    # 1行分（改行なし）の UTF-8 バイト列
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+def json_line(obj: Dict[str, Any]) -> bytes:
+    # 1行分（改行込み）の UTF-8 バイト列
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def iter_jsonl_lines(path: Path) -> Iterator[bytes]:
+    # 一括で読んで C 実装の splitlines で割り、空行を除いた各行をバイト列のまま返す
+    # （キューはその場で切り詰められるので mmap は使わない：読み中に縮むと SIGBUS になる）
+    for line in path.read_bytes().splitlines():
+        line = line.strip()
+        if line:
+            yield line
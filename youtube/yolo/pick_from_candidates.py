@@ -16,13 +16,16 @@ pick_from_candidates.py
 """
 
 import argparse
-import json
-import os
+import bisect
 import random
+from array import array
 from dataclasses import dataclass
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, Iterator, List, Tuple
+
+from jsonl_util import iter_jsonl_lines, json_dumps, json_line, json_loads
+
 
 JST = timezone(timedelta(hours=9))
 
@@ -58,23 +61,15 @@ def parse_ranges(range_args: List[str]) -> List[RangeSpec]:
     return out
 
 
-def load_jsonl(path: Path) -> List[Dict[str, Any]]:
-    rows: List[Dict[str, Any]] = []
-    with path.open("r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            rows.append(json.loads(line))
-    return rows
+def write_lines_atomic(path: Path, lines: List[bytes]) -> None:
+    # lines は改行なしの 1 行ずつ。まとめて 1 つのバッファにして 1 回で書く
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_bytes(b"\n".join(lines) + b"\n" if lines else b"")
+    tmp.replace(path)
 
 
 def write_jsonl_atomic(path: Path, rows: List[Dict[str, Any]]) -> None:
-    tmp = path.with_suffix(path.suffix + ".tmp")
-    with tmp.open("w", encoding="utf-8") as f:
-        for r in rows:
-            f.write(json.dumps(r, ensure_ascii=False) + "\n")
-    tmp.replace(path)
+    write_lines_atomic(path, [json_dumps(r) for r in rows])
 
 
 def in_range(motion: float, spec: RangeSpec) -> bool:
@@ -92,6 +87,27 @@ def overlaps(a: Tuple[int, int], b: Tuple[int, int]) -> bool:
     return not (e1 <= s2 or e2 <= s1)
 
 
+def overlaps_chosen(starts: array, ends: array, w: Tuple[int, int]) -> bool:
+    # starts/ends は start 昇順で並べた既選択窓（互いに重ならない）。
+    # 重なり得るのは挿入位置の左右隣だけなので、そこだけ見ればよい
+    i = bisect.bisect_right(starts, w[0])
+    if i > 0 and overlaps(w, (starts[i - 1], ends[i - 1])):
+        return True
+    if i < len(starts) and overlaps(w, (starts[i], ends[i])):
+        return True
+    return False
+
+
+def iter_shuffled(rng: random.Random, lst: List[int]) -> Iterator[int]:
+    # Fisher–Yates を 1 要素ずつ進めながら返す（lst はその場で並べ替える）。
+    # 必要数がそろった時点で打ち切れるうえ、重なりで弾かれても最後まで候補を見られる
+    n = len(lst)
+    for i in range(n):
+        j = rng.randrange(i, n)
+        lst[i], lst[j] = lst[j], lst[i]
+        yield lst[i]
+
+
 def main() -> None:
     ap = argparse.ArgumentParser()
     ap.add_argument("--session-dir", required=True, help="session dir (candidates_20s.jsonl がある場所)")
@@ -102,6 +118,7 @@ def main() -> None:
     ap.add_argument("--warn-empty-file", action="store_true", help="create .warn_no_xxx empty file when shortage (recommended)")
     ap.add_argument("--picked-at-key", default="picked_at", help="picked flag key name (default: picked_at)")
     ap.add_argument("--skip-uploaded", action="store_true", help="skip rows that already have video_id (safety)")
+    ap.add_argument("--dry-run", action="store_true", help="print picks only; do not touch candidates/queue/log/warn files")
     # enqueue to event_queue_yolo.jsonl（必要なときだけ）
     ap.add_argument("--enqueue", action="store_true", help="also append picked items to event_queue_yolo.jsonl")
     ap.add_argument("--event-queue", default="/media/sf_REC/posting/event_queue_yolo.jsonl", help="event queue path")
@@ -149,7 +166,9 @@ def main() -> None:
     ranges = parse_ranges(args.range)
     rng = random.Random(args.seed)
 
-    rows = load_jsonl(cand_path)
+    # 元の行（バイト列）も持っておき、書き戻しではピックした行だけ作り直す
+    raw_lines = list(iter_jsonl_lines(cand_path))
+    rows = [json_loads(line) for line in raw_lines]
 
     picked_key = args.picked_at_key
     now_iso = now_jst_iso()
@@ -158,33 +177,35 @@ def main() -> None:
     # eligible をレンジ別に集める（ただし picked 済みは除外）
     # ※候補の全件保持は candidates の段階で軽いので問題なし
     chosen_indices: List[int] = []
-    chosen_windows: List[Tuple[int, int]] = []
+    # 既選択窓を start 昇順で保持（重なり判定を二分探索で行う）
+    chosen_starts = array("i")
+    chosen_ends = array("i")
 
     # 監査用ログ
-    picked_log: List[Dict[str, Any]] = []
+    picked_log: List[Dict[str, Any]] = []  # --write-log のときだけ積む
 
-    for spec in ranges:
+    # 行ごとの判定は 1 回だけ行い、該当するレンジへ振り分ける
+    # （レンジ同士が重なっていれば両方に入る。各リストは行順のまま）
+    eligible_by_spec: List[List[int]] = [[] for _ in ranges]
+    for i, r in enumerate(rows):
         # 未picked かつ（必要なら）未uploaded
-        eligible: List[int] = []
-        for i, r in enumerate(rows):
-            if picked_key in r and r[picked_key]:
-                continue
-            if args.skip_uploaded and r.get("video_id"):
-                continue
-            m = float(r.get("motion", -1))
-            if not in_range(m, spec):
-                continue
-            # 必須項目
-            if "start_abs" not in r or "end_abs" not in r:
-                continue
-            eligible.append(i)
-
-        # ランダムに混ぜる
-        rng.shuffle(eligible)
-
+        if picked_key in r and r[picked_key]:
+            continue
+        if args.skip_uploaded and r.get("video_id"):
+            continue
+        m = float(r.get("motion", -1))
+        # 必須項目
+        if "start_abs" not in r or "end_abs" not in r:
+            continue
+        for j, spec in enumerate(ranges):
+            if in_range(m, spec):
+                eligible_by_spec[j].append(i)
+
+    for spec, eligible in zip(ranges, eligible_by_spec):
         need = spec.n
         got = 0
-        for idx in eligible:
+        # ランダムな順に見る（必要分がそろったら打ち切り）
+        for idx in iter_shuffled(rng, eligible):
             if got >= need:
                 break
             s = int(rows[idx]["start_abs"])
@@ -193,34 +214,47 @@ def main() -> None:
 
             if not args.no_overlap:
                 # 既選択と重なればスキップ
-                if any(overlaps(w, w2) for w2 in chosen_windows):
+                if overlaps_chosen(chosen_starts, chosen_ends, w):
                     continue
 
             # 採用
             chosen_indices.append(idx)
-            chosen_windows.append(w)
+            pos = bisect.bisect_right(chosen_starts, s)
+            chosen_starts.insert(pos, s)
+            chosen_ends.insert(pos, e)
             got += 1
 
-            picked_log.append(
-                {
-                    "start_abs": s,
-                    "end_abs": e,
-                    "motion": float(rows[idx]["motion"]),
-                    "range": spec.label,
-                }
-            )
+            if args.write_log:
+                picked_log.append(
+                    {
+                        "start_abs": s,
+                        "end_abs": e,
+                        "motion": float(rows[idx]["motion"]),
+                        "range": spec.label,
+                    }
+                )
 
         # 足りなければ warn
-        if got < need and args.warn_empty_file:
+        if got < need and args.warn_empty_file and not args.dry_run:
             warn_name = f".warn_no_motion_{spec.label}"
             (session_dir / warn_name).write_text("", encoding="utf-8")
 
+    if args.dry_run:
+        for idx in chosen_indices:
+            r = rows[idx]
+            print(f"[DRY] pick start_abs={r['start_abs']} end_abs={r['end_abs']} motion={r.get('motion')}")
+        print(f"[DRY] picked={len(chosen_indices)} (candidates / event_queue / log unchanged)")
+        return
+
     # candidates に picked_at を追記（追記のみ）
+    # 作り直すのはピックした行だけ。それ以外は読んだバイト列をそのまま書き戻す
     for idx in chosen_indices:
         rows[idx][picked_key] = now_iso
         rows[idx]["pick_id"] = pick_id  # 追跡用（不要なら後で外しても良い）
+        raw_lines[idx] = json_dumps(rows[idx])
 
-    write_jsonl_atomic(cand_path, rows)
+    if chosen_indices:
+        write_lines_atomic(cand_path, raw_lines)
 
     # -----------------------------
     # event_queue_yolo.jsonl へ追記（任意）
@@ -234,6 +268,8 @@ def main() -> None:
         event_queue_path.parent.mkdir(parents=True, exist_ok=True)
 
         # chosen_indices の順に publishAt を振る（一定ピッチ）
+        # 共有フォルダでは open が重いので、全行まとめて 1 回で追記する
+        queue_lines: List[bytes] = []
         for k, idx in enumerate(chosen_indices):
             r = rows[idx]
             start_abs = int(r["start_abs"])
@@ -251,8 +287,11 @@ def main() -> None:
                 "route": args.route,
             }
 
-            with event_queue_path.open("a", encoding="utf-8") as f:
-                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+            queue_lines.append(json_line(line))
+
+        if queue_lines:
+            with event_queue_path.open("ab") as f:
+                f.write(b"".join(queue_lines))
 
         print(f"[OK] enqueued_to_event_queue={len(chosen_indices)} -> {event_queue_path}")
 
@@ -260,10 +299,7 @@ def main() -> None:
     if args.write_log:
         yolo_dir = session_dir / "yolo" / pick_id
         yolo_dir.mkdir(parents=True, exist_ok=True)
-        log_path = yolo_dir / "picked.jsonl"
-        with log_path.open("w", encoding="utf-8") as f:
-            for r in picked_log:
-                f.write(json.dumps(r, ensure_ascii=False) + "\n")
+        write_jsonl_atomic(yolo_dir / "picked.jsonl", picked_log)
 
     print(f"[OK] candidates={cand_path}")
     print(f"[OK] picked={len(chosen_indices)}  pick_id={pick_id}  at={now_iso}")
@@ -33,12 +33,13 @@ run_event_queue_pipeline.py (bridge)
 """
 
 import argparse
-import json
-import re
+import os
 import subprocess
 import time
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Optional, Set, Tuple
+
+from jsonl_util import iter_jsonl_lines, json_loads
 
 # 固定テロップ（恒常）
 TEL1 = "AI自動切り抜きショート"
@@ -87,30 +88,50 @@ def touch(p: Path):
 
 def parse_event_start_abs(event_name: str) -> int:
     # "02371_02386" -> 2371
-    m = re.match(r"^(\d+)_\d+$", event_name)
-    if not m:
+    head, sep, tail = event_name.partition("_")
+    if not sep or not head.isdigit() or not tail.isdigit():
         raise ValueError(f"invalid event_name: {event_name}")
-    return int(m.group(1))
+    return int(head)
 
 
 def find_latest_decision(api_dir: Path) -> Optional[Tuple[int, Path]]:
     # api/vN/decision.json の N 最大を返す
-    best_v = None
+    best_v = -1
     best_p = None
-    if not api_dir.is_dir():
+    try:
+        with os.scandir(api_dir) as it:
+            for e in it:
+                name = e.name
+                if not name.startswith("v") or not name[1:].isdigit():
+                    continue
+                v = int(name[1:])
+                if v <= best_v:
+                    continue
+                p = Path(e.path) / "decision.json"
+                if p.exists():
+                    best_v, best_p = v, p
+    except OSError:
         return None
-    for p in api_dir.glob("v*/decision.json"):
-        m = re.match(r"^v(\d+)$", p.parent.name)
-        if not m:
-            continue
-        v = int(m.group(1))
-        if best_v is None or v > best_v:
-            best_v, best_p = v, p
-    if best_v is None or best_p is None:
+    if best_p is None:
         return None
     return best_v, best_p
 
 
+def load_enqueued_flags(upload_queue: Path) -> Set[str]:
+    # upload queue に既にある published_flag_path を一度だけ読んで集合にする
+    flags: Set[str] = set()
+    if not upload_queue.exists():
+        return flags
+    for line in iter_jsonl_lines(upload_queue):
+        try:
+            obj = json_loads(line)
+        except ValueError:
+            continue
+        if isinstance(obj, dict) and obj.get("published_flag_path"):
+            flags.add(str(obj["published_flag_path"]))
+    return flags
+
+
 def ffprobe_size(video_path: Path) -> Tuple[int, int]:
     cmd = [
         "ffprobe", "-v", "error",
@@ -122,7 +143,7 @@ def ffprobe_size(video_path: Path) -> Tuple[int, int]:
     r = subprocess.run(cmd, capture_output=True, text=True)
     if r.returncode != 0:
         raise RuntimeError(f"ffprobe failed: {r.stderr.strip()}")
-    j = json.loads(r.stdout)
+    j = json_loads(r.stdout)
     st = j.get("streams", [])
     if not st:
         raise RuntimeError("ffprobe: no video stream")
@@ -131,16 +152,13 @@ def ffprobe_size(video_path: Path) -> Tuple[int, int]:
     return w, h
 
 
+# drawtext 用エスケープ表
+# 改行は \n、: と ' と \ を逃がす（1 文字ずつ置換するので順序の心配もない）
+_DRAWTEXT_TABLE = str.maketrans({"\\": "\\\\", "\n": r"\n", ":": r"\:", "'": r"\'"})
+
+
 def escape_drawtext(s: str) -> str:
-    # drawtext 用エスケープ
-    # 改行は \n、: と ' と \ を逃がす
-    return (
-        s
-        .replace("\\", "\\\\")
-        .replace("\n", r"\n")
-        .replace(":", r"\:")
-        .replace("'", r"\'")
-    )
+    return s.translate(_DRAWTEXT_TABLE)
 
 
 def main():
@@ -172,8 +190,10 @@ def main():
     enqueued = 0
     skipped = 0
 
-    with event_queue.open("r", encoding="utf-8") as f:
-        all_lines = [ln.strip() for ln in f if ln.strip()]
+    # 重複投入チェック用（イベントごとに upload queue を読み直さない）
+    enqueued_flags = load_enqueued_flags(upload_queue)
+
+    all_lines = list(iter_jsonl_lines(event_queue))
 
     # 「触ったら削除」：今回触る行（最大 --max 行）を先に確定し、残りは最後に書き戻す
     work_lines = all_lines[: args.max]
@@ -182,7 +202,7 @@ def main():
     for ln in work_lines:
         processed += 1
         try:
-            item = json.loads(ln)
+            item = json_loads(ln)
         except Exception:
             log("[SKIP] invalid json line")
             skipped += 1
@@ -227,7 +247,7 @@ def main():
             skipped += 1
             continue
 
-        if already_enqueued(upload_queue, str(published_flag_path)):
+        if str(published_flag_path) in enqueued_flags:
             log("[SKIP] already enqueued (same published_flag_path)")
             skipped += 1
             continue
@@ -254,6 +274,7 @@ def main():
             "route": route,
         }
         append_upload_queue(upload_queue, row, dry_run=args.dry_run)
+        enqueued_flags.add(str(published_flag_path))
         enqueued += 1
 
         if args.sleep > 0:
@@ -267,9 +288,8 @@ def main():
         log(f"[DRY] event_queue unchanged (would remove {len(work_lines)} lines)")
     else:
         tmp = event_queue.with_suffix(event_queue.suffix + ".tmp")
-        with tmp.open("w", encoding="utf-8") as wf:
-            for l in remaining_lines:
-                wf.write(l + "\n")
+        with tmp.open("wb") as wf:
+            wf.write(b"".join(l + b"\n" for l in remaining_lines))
         tmp.replace(event_queue)
         log(f"[OK] event_queue dequeued: removed={len(work_lines)} remaining={len(remaining_lines)} -> {event_queue}")
 
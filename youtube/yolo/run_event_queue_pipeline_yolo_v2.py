@@ -14,57 +14,138 @@ run_event_queue_pipeline_yolo_v2.py
 """
 
 import argparse
-import json
 import os
 import re
+import shutil
 import subprocess
+import threading
 import time
-import statistics
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
 from pathlib import Path
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict, Any, Tuple
 
+import numpy as np
+
+from jsonl_util import iter_jsonl_lines, json_line, json_loads
+
 # ====== 設定項目 ======
 BGM_PATH = "/media/sf_REC/bgm/bgm_V1.mp3"
 FONTFILE = "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc"
 OUT_W, OUT_H = 720, 1280
 API_SCRIPT = "/media/sf_REC/scripts/core/api_decision_pipeline.py"
+STDERR_TAIL_LINES = 200  # 失敗時に出す stderr の末尾行数
 
 # テロップ設定
 TEL1, TEL2 = "AI自動切り抜きショート", "詳しくは説明欄へ"
 TEL3 = "チャンネル登録してね！\n見たいと思った時はライブで\nリアルなまさおが見れるかも"
+# テロップは固定なので drawtext 用のエスケープ（\ と '）は起動時に 1 回だけ（改行はそのまま渡す）
+_DRAWTEXT_TABLE = str.maketrans({"\\": "\\\\", "'": "\\'"})
+_TEL1_ESC, _TEL2_ESC, _TEL3_ESC = (t.translate(_DRAWTEXT_TABLE) for t in (TEL1, TEL2, TEL3))
+_FONTFILE_ESC = FONTFILE.replace("\\", "/").replace(":", "\\:")
+# 本編のスケール＋テロップ部分はイベントによらず同じなので起動時に組み立てておく
+_TELOP_FILTER = (
+    f"scale={OUT_W}:{OUT_H},"
+    f"drawtext=text='{_TEL1_ESC}':fontsize=54:fontcolor=white@0.45:x=(w-text_w)/2:y=180:fontfile='{_FONTFILE_ESC}',"
+    f"drawtext=text='{_TEL2_ESC}':fontsize=36:fontcolor=white@0.38:x=(w-text_w)/2:y=260:fontfile='{_FONTFILE_ESC}',"
+    f"drawtext=text='{_TEL3_ESC}':fontsize=42:fontcolor=white@1.0:borderw=4:bordercolor=black@0.9:shadowx=2:shadowy=2:shadowcolor=black@0.8:x=(w-text_w)/2:y=h-380:fontfile='{_FONTFILE_ESC}':alpha='if(lt(t,16),0,min(0.85,(t-16)*0.42))'"
+)
+_ENCODE_ARGS = (
+    "-c:v", "libx264", "-crf", "20", "-preset", "veryfast", "-pix_fmt", "yuv420p",
+    "-af", "afade=t=in:st=1:d=1,volume=0.16", "-c:a", "aac", "-b:a", "128k", "-shortest",
+)
 
 def log(msg: str):
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] {msg}", flush=True)
+    # 改行込みで 1 回の write にする（並列時に本文と改行の間へ他スレッドの行が割り込まないように）
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] {msg}\n", end="", flush=True)
 
-def run_cmd(cmd: List[str], timeout: int = 900) -> bool:
+def run_cmd(cmd: List[str], timeout: int = 900, label: str = "") -> bool:
+    # label はイベント名など。並列時にどのイベントのエラーか分かるようにログ行の頭に付ける
+    prefix = f"  {label}: " if label else ""
+    # stdout は捨て、stderr は末尾 STDERR_TAIL_LINES 行だけ保持（失敗時のログ用）
+    tail: deque = deque(maxlen=STDERR_TAIL_LINES)
     try:
-        res = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
-        if res.returncode != 0:
-            log(f"CMD_ERROR: {' '.join(cmd)}\n{res.stderr}")
+        with subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE) as proc:
+            reader = threading.Thread(target=tail.extend, args=(proc.stderr,), daemon=True)
+            reader.start()
+            try:
+                rc = proc.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+                raise
+            finally:
+                reader.join()
+        if rc != 0:
+            err = b"".join(tail).decode("utf-8", errors="replace")
+            log(f"{prefix}CMD_ERROR: {' '.join(cmd)}\n{err}")
             return False
         return True
     except Exception as e:
-        log(f"EXCEPTION: {e}")
+        log(f"{prefix}EXCEPTION: {e}")
         return False
 
+# raw_yolo.jsonl -> (sec, cx) 配列のプロセス内メモ {path: (mtime_ns, arr)}
+_RAW_YOLO_MEMO: Dict[Path, Tuple[int, np.ndarray]] = {}
+# 並列処理時に同じセッションのキャッシュを二重に作らない
+_RAW_YOLO_LOCK = threading.Lock()
+
+def _build_raw_yolo_cache(raw_yolo_path: Path) -> np.ndarray:
+    """raw_yolo.jsonl を一度だけ走査して (sec, cx) の (N,2) 配列にする"""
+    lines = raw_yolo_path.read_bytes().split(b"\n")
+    arr = np.empty((len(lines), 2), dtype=np.float64)
+    n = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            obj = json_loads(line)
+            sec = int(obj.get("sec", -1))
+            bb = obj.get("bbox_xyxy")
+            if bb and len(bb) == 4:
+                arr[n, 0] = sec
+                arr[n, 1] = (bb[0] + bb[2]) / 2.0
+                n += 1
+        except (ValueError, TypeError, KeyError, AttributeError):
+            # 壊れた行・dict でない行・数値でない bbox は飛ばす
+            continue
+    return arr[:n].copy()
+
+def _load_raw_yolo_cache(raw_yolo_path: Path) -> np.ndarray:
+    """raw_yolo.npy を使う（元ログより古ければ作り直して保存）"""
+    mtime_ns = raw_yolo_path.stat().st_mtime_ns
+    memo = _RAW_YOLO_MEMO.get(raw_yolo_path)
+    if memo is not None and memo[0] == mtime_ns:
+        return memo[1]
+    cache = raw_yolo_path.with_suffix(".npy")
+    arr = None
+    try:
+        if cache.stat().st_mtime_ns >= mtime_ns:
+            arr = np.load(cache)
+    except (OSError, ValueError):
+        arr = None
+    if arr is None:
+        arr = _build_raw_yolo_cache(raw_yolo_path)
+        tmp = cache.with_suffix(".npy.tmp")
+        try:
+            with tmp.open("wb") as f:
+                np.save(f, arr)
+            tmp.replace(cache)
+        except OSError as e:
+            log(f"  [WARN] raw_yolo cache not saved ({cache}): {e}")
+    _RAW_YOLO_MEMO[raw_yolo_path] = (mtime_ns, arr)
+    return arr
+
 def get_median_cx(raw_yolo_path: Path, start_abs: int, end_abs: int) -> float:
     """YOLOログから指定区間の cx 中央値を算出"""
-    cxs = []
     if not raw_yolo_path.exists():
         return 320.0 # fallback
-    with raw_yolo_path.open("r", encoding="utf-8") as f:
-        for line in f:
-            try:
-                obj = json.loads(line)
-                sec = int(obj.get("sec", -1))
-                if start_abs <= sec <= end_abs:
-                    bb = obj.get("bbox_xyxy")
-                    if bb and len(bb) == 4:
-                        cx = (bb[0] + bb[2]) / 2.0
-                        cxs.append(cx)
-            except: continue
-    return statistics.median(cxs) if cxs else 320.0
+    with _RAW_YOLO_LOCK:
+        arr = _load_raw_yolo_cache(raw_yolo_path)
+    mask = (arr[:, 0] >= start_abs) & (arr[:, 0] <= end_abs)
+    return float(np.median(arr[mask, 1])) if mask.any() else 320.0
 
 def calculate_crop_x(cx: float, source_w: int = 640) -> int:
     """cx を中心に据える crop_x (x1) を計算"""
@@ -74,23 +155,25 @@ def calculate_crop_x(cx: float, source_w: int = 640) -> int:
     # クランプ (640x360想定)
     return max(0, min(crop_x, 640 - int(target_w_in_360)))
 
-def export_cropped_previews(raw_path: Path, out_dir: Path, start_abs: int, dur: int, crop_x_360: int):
-    """API用に1fpsでクロップ済み画像を書き出し"""
+def _prepare_preview_tmp(out_dir: Path) -> Path:
+    """API用プレビューの書き出し先（out_dir.tmp）を空で用意する"""
+    tmp = out_dir.with_name(out_dir.name + ".tmp")
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    tmp.mkdir(parents=True)
+    return tmp
+
+def _swap_in_previews(tmp: Path, out_dir: Path):
+    """書き出し済みの tmp を out_dir に差し替える（古い方の削除は裏で行う）"""
+    old = None
     if out_dir.exists():
-        import shutil
-        shutil.rmtree(out_dir)
-    out_dir.mkdir(parents=True, exist_ok=True)
-    
-    # 360p素材(=crop_x_360) を 720p相当にスケールしてクロップ
-    # ih*9/16 がスマホ幅。360*9/16 = 202.5
-    # crop_x_360 * 3 = 1080p の時の位置
-    cmd = [
-        "ffmpeg", "-y", "-ss", str(start_abs), "-t", str(dur),
-        "-i", str(raw_path),
-        "-vf", f"fps=1,crop=ih*9/16:ih:{crop_x_360*3}:0,scale=225:400",
-        str(out_dir / "frame_%03d.jpg")
-    ]
-    run_cmd(cmd)
+        old = out_dir.with_name(out_dir.name + ".old")
+        if old.exists():
+            shutil.rmtree(old)  # 前回の消し残し
+        os.rename(out_dir, old)
+    os.rename(tmp, out_dir)
+    if old is not None:
+        threading.Thread(target=shutil.rmtree, args=(old,), kwargs={"ignore_errors": True}, daemon=True).start()
 
 def call_api_for_content(event_dir: Path, frames_dir: Path):
     """APIスクリプトを呼び出して内容を確定させる"""
@@ -101,39 +184,124 @@ def call_api_for_content(event_dir: Path, frames_dir: Path):
         "--api2-prompt-file", "/media/sf_REC/prompts/api2_system_yolo.txt",
         "--step", "2"
     ]
-    log(f"  Calling API with frames from {frames_dir.name}...")
-    run_cmd(cmd)
+    log(f"  {event_dir.name}: Calling API with frames from {frames_dir.name}...")
+    run_cmd(cmd, label=event_dir.name)
 
-def render_video(raw_path: Path, out_path: Path, start_abs: int, dur: int, crop_x_360: int):
-    """BGM・テロップ入りの最終動画生成"""
+def render_video(raw_path: Path, out_path: Path, start_abs: int, dur: int, crop_x_360: int,
+                 preview_dir: Optional[Path] = None, label: str = "", threads: int = 0):
+    """BGM・テロップ入りの最終動画生成（preview_dir 指定時は API 用 1fps 画像も同時に書き出す）"""
     crop_x = crop_x_360 * 3 # 1080p相当
-    tel1 = TEL1.replace("\\", "\\\\").replace("'", "\\'")
-    tel2 = TEL2.replace("\\", "\\\\").replace("'", "\\'")
-    tel3_file = out_path.with_suffix(".tel3.txt")
-    tel3_file.parent.mkdir(parents=True, exist_ok=True)
-    tel3_file.write_text(TEL3, encoding="utf-8")
-    tel3_file_ff = str(tel3_file).replace("\\", "/").replace(":", "\\:").replace("'", "\\'")
+    # デコードは 1 回だけ。クロップ後に split して本編とプレビュー（1fps・225x400）に分ける
+    # ih*9/16 がスマホ幅。crop_x_360 * 3 = 1080p の時の位置
+    crop = f"[0:v]crop=ih*9/16:ih:{crop_x}:0"
+    if preview_dir is not None:
+        preview_tmp = _prepare_preview_tmp(preview_dir)
+        graph = f"{crop},split=2[main][prev];[prev]fps=1,scale=225:400[pv];[main]{_TELOP_FILTER}[vout]"
+    else:
+        graph = f"{crop},{_TELOP_FILTER}[vout]"
     cmd = [
         "ffmpeg", "-y", "-hide_banner",
         "-ss", str(start_abs), "-t", str(dur), "-i", str(raw_path),
         "-stream_loop", "-1", "-i", BGM_PATH,
-        "-vf",
-        f"crop=ih*9/16:ih:{crop_x}:0,scale={OUT_W}:{OUT_H},"
-        f"drawtext=text='{tel1}':fontsize=54:fontcolor=white@0.45:x=(w-text_w)/2:y=180:fontfile='{FONTFILE}',"
-        f"drawtext=text='{tel2}':fontsize=36:fontcolor=white@0.38:x=(w-text_w)/2:y=260:fontfile='{FONTFILE}',"
-        f"drawtext=textfile='{tel3_file_ff}':fontsize=42:fontcolor=white@1.0:borderw=4:bordercolor=black@0.9:shadowx=2:shadowy=2:shadowcolor=black@0.8:x=(w-text_w)/2:y=h-380:fontfile='{FONTFILE}':alpha='if(lt(t,16),0,min(0.85,(t-16)*0.42))'",
-        "-map", "0:v:0", "-map", "1:a:0",
-        "-c:v", "libx264", "-crf", "20", "-preset", "veryfast", "-pix_fmt", "yuv420p",
-        "-af", "afade=t=in:st=1:d=1,volume=0.16", "-c:a", "aac", "-b:a", "128k", "-shortest",
+        "-filter_complex", graph,
+        "-map", "[vout]", "-map", "1:a:0",
+        *_ENCODE_ARGS,
+        *(("-threads", str(threads)) if threads > 0 else ()),
         str(out_path)
     ]
-    ok = run_cmd(cmd, timeout=1200)
-    try:
-        tel3_file.unlink(missing_ok=True)
-    except Exception:
-        pass
+    if preview_dir is not None:
+        cmd += ["-map", "[pv]", str(preview_tmp / "frame_%03d.jpg")]
+    ok = run_cmd(cmd, timeout=1200, label=label)
+    if ok and preview_dir is not None:
+        _swap_in_previews(preview_tmp, preview_dir)
     return ok
 
+def _encode_threads(workers: int) -> int:
+    """並列時の libx264 スレッド数（コアを等分して取り合いを避ける）。直列なら 0 = ffmpeg 任せ"""
+    if workers <= 1:
+        return 0
+    return max(1, (os.cpu_count() or 1) // workers)
+
+def _process_event(item: Dict[str, Any], args: argparse.Namespace, threads: int = 0) -> Optional[Dict[str, Any]]:
+    """1イベント分（クロップ位置決定→生成→API）。成功時はアップロードキューの行を返す"""
+    try:
+        ev_dir = Path(item["event_dir"])
+        sess_dir = Path(item["session_dir"])
+        ev_name = item["event_name"]
+        
+        log(f"Processing {ev_name}...")
+        
+        # 1. クロップ位置決定
+        start_abs = int(ev_name.partition("_")[0])
+        raw_yolo = sess_dir / "raw_yolo.jsonl"
+        med_cx = get_median_cx(raw_yolo, start_abs, start_abs + 20)
+        crop_x_360 = calculate_crop_x(med_cx)
+        log(f"  {ev_name}: median_cx={med_cx:.1f} -> crop_x_360={crop_x_360}")
+        
+        raw_mkv = sess_dir / "raw.mkv"
+        api_frames_dir = ev_dir / "images_cropped" 
+        v_dir = ev_dir / "api" / "v1" 
+        decision_json = v_dir / "decision.json"
+
+        out_mp4 = ev_dir / "shorts" / f"{ev_name}_v1_bgm_V1.mp4"
+        if out_mp4.exists() and not args.force:
+            log(f"  [SKIP] {ev_name}: mp4 already exists: {out_mp4}")
+            # まだキューに追加されていないなら追加するなどの処理が必要ならここに書く
+            return None
+
+        if args.no_api:
+            log(f"  {ev_name}: Skipping API step (--no-api)")
+            if not decision_json.exists():
+                log(f"  [ERROR] {ev_name}: decision.json not found in {v_dir}. Cannot skip API.")
+                return None
+
+        out_mp4.parent.mkdir(parents=True, exist_ok=True)
+        # decision.json が揃うまでは仮名で持つ（途中で落ちても「生成済み」扱いで飛ばされないように）
+        tmp_mp4 = out_mp4.with_name(out_mp4.stem + ".tmp.mp4")
+
+        # 2. 本編生成（API を呼ぶときは同じ ffmpeg で API 用画像も書き出す）
+        preview_dir = None if args.no_api else api_frames_dir
+        if not render_video(raw_mkv, tmp_mp4, start_abs, 20, crop_x_360, preview_dir, label=ev_name, threads=threads):
+            log(f"  [ERROR] Rendering failed for {ev_name}")
+            tmp_mp4.unlink(missing_ok=True)
+            return None
+
+        # 3. API呼出
+        if not args.no_api:
+            call_api_for_content(ev_dir, api_frames_dir)
+            if not decision_json.exists():
+                log(f"  [ERROR] {ev_name}: decision.json not found in {v_dir}.")
+                tmp_mp4.unlink(missing_ok=True)
+                return None
+        os.replace(tmp_mp4, out_mp4)
+
+        # 4. アップロードキュー追加
+        row = {
+            "video_path": str(out_mp4),
+            "decision_path": str(decision_json),
+            "published_flag_path": str(v_dir / ".published"),
+            "publishAt": item["publishAt"],
+            "route": item.get("route", "yolo")
+        }
+        log(f"  OK: {ev_name} -> {out_mp4}")
+        return row
+
+    except Exception as e:
+        log(f"  [ERROR] Failed to process {item.get('event_name', '?')}: {e}")
+    return None
+
+_UPLOAD_LOCK = threading.Lock()
+
+def _process_and_enqueue(item: Dict[str, Any], args: argparse.Namespace, threads: int = 0) -> None:
+    """1イベント処理し、終わった時点でアップロードキューへ 1 行追記する（中断しても済んだ分は残る）"""
+    row = _process_event(item, args, threads)
+    if row is None:
+        return
+    line = json_line(row)
+    with _UPLOAD_LOCK:
+        with open(args.upload_queue, "ab") as f:
+            f.write(line)
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--event-queue", default="/media/sf_REC/posting/event_queue_yolo.jsonl")
@@ -142,6 +310,7 @@ def main():
     ap.add_argument("--max", type=int, default=5)
     ap.add_argument("--no-api", action="store_true", help="Skip API call and use existing decision.json")
     ap.add_argument("--force", action="store_true", help="Overwrite existing mp4")
+    ap.add_argument("--parallel", type=int, default=2, help="Number of events processed concurrently (1 = serial)")
     args = ap.parse_args()
 
     # 個別指定モードの判定
@@ -165,78 +334,28 @@ def main():
         if not q_path.exists():
             log(f"Queue not found: {q_path}")
             return
-        with q_path.open("r", encoding="utf-8") as f:
-            lines = [l.strip() for l in f if l.strip()]
+        lines = list(iter_jsonl_lines(q_path))
         if not lines:
             log("Queue is empty.")
             return
-        work_items = [json.loads(l) for l in lines[:args.max]]
+        work_items = [json_loads(l) for l in lines[:args.max]]
         rem_lines = lines[args.max:]
         queue_mode = True
 
-    for item in work_items:
-        try:
-            ev_dir = Path(item["event_dir"])
-            sess_dir = Path(item["session_dir"])
-            ev_name = item["event_name"]
-            
-            log(f"Processing {ev_name}...")
-            
-            # 1. クロップ位置決定
-            start_abs = int(ev_name.split("_")[0])
-            raw_yolo = sess_dir / "raw_yolo.jsonl"
-            med_cx = get_median_cx(raw_yolo, start_abs, start_abs + 20)
-            crop_x_360 = calculate_crop_x(med_cx)
-            log(f"  median_cx={med_cx:.1f} -> crop_x_360={crop_x_360}")
-            
-            # 2. 画像書き出し & API
-            raw_mkv = sess_dir / "raw.mkv"
-            api_frames_dir = ev_dir / "images_cropped" 
-            
-            if not args.no_api:
-                export_cropped_previews(raw_mkv, api_frames_dir, start_abs, 20, crop_x_360)
-                # API呼出
-                call_api_for_content(ev_dir, api_frames_dir)
-            else:
-                log("  Skipping API step (--no-api)")
-
-            # 3. 本編生成
-            v_dir = ev_dir / "api" / "v1" 
-            decision_json = v_dir / "decision.json"
-            if not decision_json.exists():
-                log(f"  [ERROR] decision.json not found in {v_dir}. Cannot skip API.")
-                continue
-
-            out_mp4 = ev_dir / "shorts" / f"{ev_name}_v1_bgm_V1.mp4"
-            if out_mp4.exists() and not args.force:
-                log(f"  [SKIP] mp4 already exists: {out_mp4}")
-                # まだキューに追加されていないなら追加するなどの処理が必要ならここに書く
-                continue
-
-            out_mp4.parent.mkdir(exist_ok=True)
-            
-            if render_video(raw_mkv, out_mp4, start_abs, 20, crop_x_360):
-                # 4. アップロードキュー追加
-                row = {
-                    "video_path": str(out_mp4),
-                    "decision_path": str(decision_json),
-                    "published_flag_path": str(v_dir / ".published"),
-                    "publishAt": item["publishAt"],
-                    "route": item.get("route", "yolo")
-                }
-                with open(args.upload_queue, "a", encoding="utf-8") as f:
-                    f.write(json.dumps(row, ensure_ascii=False) + "\n")
-                log(f"  OK: {ev_name} -> {out_mp4}")
-            else:
-                log(f"  [ERROR] Rendering failed for {ev_name}")
-
-        except Exception as e:
-            log(f"  [ERROR] Failed to process line: {e}")
+    # ffmpeg / API は外部プロセス待ちなのでスレッドで並べる（1 で直列）
+    workers = min(args.parallel, len(work_items))
+    if workers > 1:
+        threads = _encode_threads(workers)
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            list(ex.map(_process_and_enqueue, work_items, repeat(args), repeat(threads)))
+    else:
+        for item in work_items:
+            _process_and_enqueue(item, args)
 
     # キュー更新（個別指定モードでない場合のみ）
     if queue_mode:
-        with q_path.open("w", encoding="utf-8") as f:
-            for l in rem_lines: f.write(l + "\n")
+        with q_path.open("wb") as f:
+            f.write(b"".join(l + b"\n" for l in rem_lines))
         log(f"Queue updated. (rem={len(rem_lines)})")
     else:
         log("Manual processing finished.")